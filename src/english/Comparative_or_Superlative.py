@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import os
+
 from russian.Syllables import SyllableModule
 
 
@@ -9,7 +11,8 @@ class AdjectiveComparisoner(object):
                                      "much": ["more", "most"]}
 
         self.irreg_comp_adj = {}
-        with open("resources/irregular_adjectives.txt", "r") as f:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "irregular_adjectives.txt")
+        with open(path, "r") as f:
             for line in f:
                 comparative, adjective = line.strip().split()
                 self.irreg_comp_adj[comparative] = adjective
@@ -2,12 +2,14 @@
 
 """ This Questioner can generate questions to verbs of Present Simple,
     Past Simple and Present Future Tenses """
+import os
 
 
 class Questioner(object):
     def __init__(self):
         self.irregular_verbs = {}
-        with open("resources/irregular_verbs.txt", "r") as f:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "irregular_verbs.txt")
+        with open(path, "r") as f:
             for line in f:
                 infinit, irreg_verb, _ = line.strip().split()
                 self.irregular_verbs[irreg_verb.upper()] = infinit.upper()
@@ -5,15 +5,19 @@ Pos-tagging for Russian Translit
 https://www.kaggle.com/c/pos-punk
 """
 
-import pandas as pd
-
+import argparse
+import hashlib
+import os
 import re
 import string
+import time
+from functools import lru_cache
+from itertools import groupby
+
+import numpy as np
 
-from seqlearn.datasets import load_conll
-from seqlearn.evaluation import whole_sequence_accuracy
-from seqlearn.perceptron import StructuredPerceptron
-from sklearn.metrics.classification import accuracy_score, f1_score
+# bump when features() changes: saved models are tied to the feature set they were trained with
+FEATURES_VERSION = 1
 
 real_num_pattern = re.compile('\d+([\.\,\:\/]\d)+')
 currency_pattern = re.compile('[\$€£¢¥₽\+\-\*\/\^\=]')
@@ -31,11 +35,13 @@ def digits_count(seq):
     return len([j.isdigit() for j in seq])
 
 
+@lru_cache(maxsize=None)
+def get_char_shape(s):
+    return 'X' if re.search('[A-ZЁ]', s) else 'x' if re.search('[a-zё]', s) else 'd' if re.search('\d', s) else s
+
+
 def get_word_shape(seq):
-    return ''.join([
-        'X' if re.search('[A-ZЁ]', s) else 'x' if re.search('[a-zё]', s) else 'd' if re.search('\d', s) else s
-        for s in seq
-    ])
+    return ''.join([get_char_shape(s) for s in seq])
 
 
 def get_short_word_shape(seq):
@@ -46,178 +52,538 @@ def is_punctuation(seq):
     return all([j in string.punctuation for j in seq])
 
 
-def features(sequence, i):
-    """
-        Generate features from inputs
-
-        :param sequence: columns set
-        :param i: word number
-        :return: features set
-    """
-    seq = sequence[i].split("\t")[1]
-
-    # first position in the sentence
-    if i == 0:
-        yield "first"
-
-    if i == len(sequence) - 1:
-        yield "last"
-
-    # word's length
-    yield "len=" + get_word_len(seq)
+tel_nik_pattern = re.compile(r'\w+(tel|nik)')
+k_suffix_pattern = re.compile(r'\w+[bjlmnpstvz]k')
+v_suffix_pattern = re.compile(r'\w+(st|z|o)v')
+eiok_suffix_pattern = re.compile(r'\w+[eio]k')
+stn_suffix_pattern = re.compile(r'\w+stn')
+dr_suffix_pattern = re.compile(r'\w+[dk]r')
+shk_suffix_pattern = re.compile(r'\w+(sh|jj)k')
+lnk_suffix_pattern = re.compile(r'\w+[ln]`k')
+n_suffix_pattern = re.compile(r'\w+[jlmrstvz]n')
+part_sch_suffixes_pattern = re.compile(r'\w+((y[au]|i)s?ch|vsh)')
 
-    # first 4 letters
-    yield "first_four_letters=" + seq[:4] if len(seq) > 4 else seq
 
-    # last 3 letters
-    yield "last_three_letters=" + seq[-3:] if len(seq) > 3 else seq
+@lru_cache(maxsize=1 << 18)
+def word_features(seq):
+    """
+        Features of the word itself, computed once per word type
 
-    # word shape
-    yield "word_shape=" + str(get_word_shape(seq))
-    yield "short_word_shape=" + get_short_word_shape(seq)
+        :param seq: word
+        :return: features tuple
+    """
+    result = [
+        # word's length
+        "len=" + get_word_len(seq),
+        # first 4 letters
+        "first_four_letters=" + seq[:4] if len(seq) > 4 else seq,
+        # last 3 letters
+        "last_three_letters=" + seq[-3:] if len(seq) > 3 else seq,
+        # word shape
+        "word_shape=" + str(get_word_shape(seq)),
+        "short_word_shape=" + get_short_word_shape(seq)
+    ]
 
     if seq.istitle():
-        yield "title"
+        result.append("title")
 
     if seq.isupper():
-        yield "upper"
+        result.append("upper")
 
     if is_punctuation(seq):
-        yield "is_punct"
+        result.append("is_punct")
 
     if '-' in seq:
-        yield "has_dash"
+        result.append("has_dash")
 
-    yield "digits_count=" + str(digits_count(seq))
+    result.append("digits_count=" + str(digits_count(seq)))
 
     # only alpha or digit
     if seq.isalpha():
-        yield "alpha"
+        result.append("alpha")
 
     # only digits
     if real_num_pattern.search(seq) or seq.isdigit():
-        yield "num"
+        result.append("num")
 
     # currency
     if currency_pattern.search(seq):
-        yield "currency"
+        result.append("currency")
 
     # contains -'its'
-    if 'its' in seq or re.search(r'\w+(tel|nik)', seq):
-        yield "with_tel_its"
+    if 'its' in seq or tel_nik_pattern.search(seq):
+        result.append("with_tel_its")
 
     # contains letter + 'к' suffix
-    if re.search(r'\w+[bjlmnpstvz]k', seq):
-        yield "with_k_suffix"
+    if k_suffix_pattern.search(seq):
+        result.append("with_k_suffix")
 
     # contains letter + 'в' suffix
-    if re.search(r'\w+(st|z|o)v', seq):
-        yield "with_v_suffix"
+    if v_suffix_pattern.search(seq):
+        result.append("with_v_suffix")
 
-    if re.search(r'\w+[eio]k', seq):
-        yield "with_eiok_suffix"
+    if eiok_suffix_pattern.search(seq):
+        result.append("with_eiok_suffix")
 
-    if re.search(r'\w+stn', seq):
-        yield "with_stn_suffix"
+    if stn_suffix_pattern.search(seq):
+        result.append("with_stn_suffix")
 
-    if re.search(r'\w+[dk]r', seq):
-        yield "with_dr_suffix"
+    if dr_suffix_pattern.search(seq):
+        result.append("with_dr_suffix")
 
-    if re.search(r'\w+(sh|jj)k', seq):
-        yield "with_shk_suffix"
+    if shk_suffix_pattern.search(seq):
+        result.append("with_shk_suffix")
 
-    if re.search(r'\w+[ln]`k', seq):
-        yield "with_lnk_suffix"
+    if lnk_suffix_pattern.search(seq):
+        result.append("with_lnk_suffix")
 
     # contains 'нн'
     if 'nn' in seq:
-        yield "with_nn"
+        result.append("with_nn")
 
     # contains 'чн', 'чк'
     if 'chk' in seq or 'chn' in seq or 'schn' in seq:
-        yield "with_chk"
+        result.append("with_chk")
 
     # contains letter + 'н' suffix
-    if re.search(r'\w+[jlmrstvz]n', seq):
-        yield "with_n_suffix"
+    if n_suffix_pattern.search(seq):
+        result.append("with_n_suffix")
 
     # contains suffixes 'ющ', 'ящ', 'ищ', 'вш'
-    if re.search(r'\w+((y[au]|i)s?ch|vsh)', seq) or seq.endswith('v'):
-        yield "with_part_sch_suffixes"
+    if part_sch_suffixes_pattern.search(seq) or seq.endswith('v'):
+        result.append("with_part_sch_suffixes")
 
     # ends with 'ся'
     if seq.endswith("sya") or seq.endswith('s\''):
-        yield "ends_with_sya"
+        result.append("ends_with_sya")
 
-    if i > 0:
-        prev = sequence[i - 1].split("\t")[1]
-        # previous word's length
-        yield "prev_len=" + str(get_word_len(prev))
+    return tuple(result)
 
-    if i > 0:
-        prev = sequence[i - 1].split("\t")[1]
-        # previous word is title
-        yield "prev_title=" + str(prev.istitle())
 
-    if i > 0:
-        prev = sequence[i - 1].split("\t")[1]
-        # last letters of the previous word
-        yield "prev_last_letters=" + (prev[-3:] if len(prev) > 3 else prev)
+@lru_cache(maxsize=1 << 18)
+def neighbour_features(position, seq):
+    """
+        Features of the previous or the next word, computed once per word type
+
+        :param position: "prev" or "next"
+        :param seq: neighbour word
+        :return: features tuple
+    """
+    return (
+        # neighbour word's length
+        position + "_len=" + str(get_word_len(seq)),
+        # neighbour word is title
+        position + "_title=" + str(seq.istitle()),
+        # last letters of the neighbour word
+        position + "_last_letters=" + (seq[-3:] if len(seq) > 3 else seq),
+        # neighbour word is alnum
+        position + "_is_alnum=" + str(seq.isalnum())
+    )
+
+
+def sentence_words(sequence):
+    return [line.split("\t")[1] for line in sequence]
+
+
+def features(sequence, i):
+    """
+        Generate features from inputs, the callback signature of seqlearn's load_conll.
+        The sentence is split on every call, batch code splits it once and calls words_features
+
+        :param sequence: columns set
+        :param i: word number
+        :return: features set
+    """
+    return words_features(sentence_words(sequence), i)
+
+
+def words_features(words, i):
+    """
+        :param words: words of the sentence
+        :param i: word number
+        :return: features set
+    """
+    # first position in the sentence
+    if i == 0:
+        yield "first"
+
+    if i == len(words) - 1:
+        yield "last"
+
+    yield from word_features(words[i])
 
     if i > 0:
-        prev = sequence[i - 1].split("\t")[1]
-        # previous word is alnum
-        yield "prev_is_alnum=" + str(prev.isalnum())
+        yield from neighbour_features("prev", words[i - 1])
 
-    if i < len(sequence) - 1:
-        next = sequence[i + 1].split("\t")[1]
-        # next word's length
-        yield "next_len=" + str(get_word_len(next))
+    if i < len(words) - 1:
+        yield from neighbour_features("next", words[i + 1])
 
-    if i < len(sequence) - 1:
-        next = sequence[i + 1].split("\t")[1]
-        # next word is title
-        yield "next_title=" + str(next.istitle())
 
-    if i < len(sequence) - 1:
-        next = sequence[i + 1].split("\t")[1]
-        # last letters of the next word
-        yield "next_last_letters=" + (next[-3:] if len(next) > 3 else next)
+def murmurhash3_32(data, seed=0):
+    """
+        Signed 32-bit MurmurHash3 (x86), the hash used by sklearn's FeatureHasher
 
-    if i < len(sequence) - 1:
-        next = sequence[i + 1].split("\t")[1]
-        # next word is alnum
-        yield "next_is_alnum=" + str(next.isalnum())
+        :param data: bytes
+        :param seed: hash seed
+        :return: signed int
+    """
+    c1, c2, mask = 0xcc9e2d51, 0x1b873593, 0xffffffff
+    length = len(data)
+    h = seed
+    rounded_end = length & ~3
+
+    for i in range(0, rounded_end, 4):
+        k = int.from_bytes(data[i:i + 4], 'little')
+        k = (k * c1) & mask
+        k = ((k << 15) | (k >> 17)) & mask
+        h ^= (k * c2) & mask
+        h = ((h << 13) | (h >> 19)) & mask
+        h = (h * 5 + 0xe6546b64) & mask
+
+    tail = length & 3
+    if tail:
+        k = int.from_bytes(data[rounded_end:], 'little')
+        k = (k * c1) & mask
+        k = ((k << 15) | (k >> 17)) & mask
+        h ^= (k * c2) & mask
+
+    h ^= length
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & mask
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & mask
+    h ^= h >> 16
+    return h - (1 << 32) if h & 0x80000000 else h
+
+
+@lru_cache(maxsize=1 << 20)
+def hash_feature(feature, n_features):
+    """
+        Column and sign of a string feature, the same as FeatureHasher(n_features, input_type="string")
+        used by seqlearn's load_conll
 
-# читаем обучающее множество
-X_train, y_train, lengths_train = load_conll(open("../resources/train.data", "r"), features)
+        :param feature: feature string
+        :param n_features: hashing space dimension
+        :return: (index, sign)
+    """
+    h = murmurhash3_32(feature.encode("utf-8"))
+    index = (2147483647 - (n_features - 1)) % n_features if h == -2147483648 else abs(h) % n_features
+    return index, 1 if h >= 0 else -1
 
-clf = StructuredPerceptron(decode="viterbi", lr_exponent=.05, max_iter=50)
 
-print("Fitting model " + str(clf))
-clf.fit(X_train, y_train, lengths_train)
+def read_conll(f):
+    """
+        Sentences of a CoNLL file, split the same way as seqlearn's load_conll
 
-print("\nPredictions on dev set")
+        :param f: opened file
+        :return: generator of (columns tuple, labels tuple)
+    """
+    lines = (line.strip() for line in f)
+    for nonempty, group in groupby(lines, bool):
+        if nonempty:
+            sequence, labels = zip(*(line.rsplit(None, 1) for line in group))
+            yield sequence, labels
 
-# читаем отладочное множество
-X_dev, y_dev, lengths_dev = load_conll(open("../resources/dev.data", "r"), features)
-y_pred = clf.predict(X_dev, lengths_dev)
 
-print("Whole seq accuracy    ", whole_sequence_accuracy(y_dev, y_pred, lengths_dev))
-print("Element-wise accuracy ", accuracy_score(y_dev, y_pred))
-print("Mean F1-score macro   ", f1_score(y_dev, y_pred, average="macro"))
+def _hash_sentences(args):
+    sentences, n_features = args
+    from sklearn.feature_extraction import FeatureHasher
 
-print("\nPredictions on test set")
+    hasher = FeatureHasher(n_features=n_features, input_type="string")
+    return hasher.transform(words_features(words, i)
+                            for words in map(sentence_words, sentences) for i in range(len(words)))
 
-# читаем тестовое множество
-X_test, _, lengths_test = load_conll(open("../resources/test.data", "r"), features)
-y_pred = clf.predict(X_test, lengths_test)
 
-print(pd.Series(y_pred).value_counts())
+def file_digest(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
 
-print("Saving predicted as a submission")
 
-with open("submission.csv", "w") as wf:
-    wf.write("id,tag\n")
-    for id, tag in enumerate(list(y_pred)):
-        wf.write(str(id + 1) + "," + tag + "\n")
+def extract_features(path, n_features=2 ** 16, workers=None, chunksize=512, cache_dir=None):
+    """
+        The same (X, y, lengths) as seqlearn's load_conll(f, features, n_features), but sentences are hashed
+        by a process pool in chunks and the result is cached on disk
+
+        :param path: CoNLL file
+        :param n_features: hashing space dimension
+        :param workers: number of processes, cpu count by default; no pool is created for 1
+        :param chunksize: sentences per pool task
+        :param cache_dir: directory of extracted matrices, keyed by file sha1, FEATURES_VERSION and n_features;
+            None disables the cache
+        :return: (scipy.sparse.csr_matrix, labels, lengths)
+    """
+    import scipy.sparse as sp
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, "{}_v{}_{}.npz".format(file_digest(path), FEATURES_VERSION, n_features))
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                X = sp.csr_matrix((cached["data"], cached["indices"], cached["indptr"]), shape=tuple(cached["shape"]))
+                return X, cached["labels"], cached["lengths"]
+
+    with open(path, "r") as f:
+        sentences = list(read_conll(f))
+
+    chunks = [[sequence for sequence, _ in sentences[start:start + chunksize]]
+              for start in range(0, len(sentences), chunksize)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) < 2:
+        blocks = [_hash_sentences((chunk, n_features)) for chunk in chunks]
+    else:
+        from multiprocessing import Pool
+
+        with Pool(min(workers, len(chunks))) as pool:
+            blocks = pool.map(_hash_sentences, [(chunk, n_features) for chunk in chunks])
+
+    X = sp.vstack(blocks, format="csr") if blocks else sp.csr_matrix((0, n_features))
+    y = np.asarray([label for _, labels in sentences for label in labels])
+    lengths = np.asarray([len(labels) for _, labels in sentences], dtype=np.int32)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # сначала во временный файл, чтобы прерванная запись не оставила битый кэш
+        partial_path = cache_path + ".partial.npz"
+        np.savez_compressed(partial_path, data=X.data, indices=X.indices, indptr=X.indptr,
+                            shape=np.array(X.shape), labels=y, lengths=lengths)
+        os.replace(partial_path, cache_path)
+
+    return X, y, lengths
+
+
+class PosTagger(object):
+    """
+        Inference part of the structured perceptron: weights and the hashed feature space.
+        Tagging needs only numpy, training-time libraries are not imported
+    """
+
+    def __init__(self, coef, intercept_init, intercept_final, intercept_trans, classes, n_features=2 ** 16):
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept_init = np.asarray(intercept_init, dtype=np.float64)
+        self.intercept_final = np.asarray(intercept_final, dtype=np.float64)
+        self.intercept_trans = np.asarray(intercept_trans, dtype=np.float64)
+        self.classes = np.asarray(classes)
+        self.n_features = int(n_features)
+
+        # (n_features, n_classes): the rows of the hashed features are gathered while scoring
+        self.weights = np.ascontiguousarray(self.coef.T)
+
+    @classmethod
+    def from_estimator(cls, clf, n_features=2 ** 16):
+        return cls(clf.coef_, clf.intercept_init_, clf.intercept_final_, clf.intercept_trans_,
+                   clf.classes_, n_features)
+
+    def save(self, path):
+        np.savez_compressed(path, coef=self.coef, intercept_init=self.intercept_init,
+                            intercept_final=self.intercept_final, intercept_trans=self.intercept_trans,
+                            classes=self.classes, n_features=self.n_features, features_version=FEATURES_VERSION)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as model:
+            if int(model["features_version"]) != FEATURES_VERSION:
+                raise ValueError("Model %s was trained with features version %d, current is %d"
+                                 % (path, int(model["features_version"]), FEATURES_VERSION))
+            return cls(model["coef"], model["intercept_init"], model["intercept_final"],
+                       model["intercept_trans"], model["classes"], int(model["n_features"]))
+
+    def emissions(self, sequences):
+        """
+            Emission scores of a batch of sentences in the CoNLL columns form, padded to the longest one
+
+            :param sequences: list of columns sets ("id\tword" strings)
+            :return: (n_sentences, max_len, n_classes) array
+        """
+        max_len = max(len(sequence) for sequence in sequences)
+        rows, indices, signs = [], [], []
+        for n, words in enumerate(map(sentence_words, sequences)):
+            for i in range(len(words)):
+                row = n * max_len + i
+                for feature in words_features(words, i):
+                    index, sign = hash_feature(feature, self.n_features)
+                    rows.append(row)
+                    indices.append(index)
+                    signs.append(sign)
+
+        scores = np.zeros((len(sequences) * max_len, len(self.classes)))
+        np.add.at(scores, rows, np.asarray(signs, dtype=np.float64)[:, None] * self.weights[indices])
+        return scores.reshape(len(sequences), max_len, len(self.classes))
+
+    def viterbi(self, scores, lengths):
+        """
+            Best tag sequences for a padded batch, the same decoding as seqlearn's viterbi.
+            Every step is done for the whole batch at once, finished sentences keep their scores
+
+            :param scores: (n_sentences, max_len, n_classes) emission scores
+            :param lengths: sentence lengths
+            :return: (n_sentences, max_len) array of class indices, padding is filled with zeros
+        """
+        n_sentences, max_len, n_classes = scores.shape
+        lengths = np.asarray(lengths)
+        backpointers = np.zeros((n_sentences, max_len, n_classes), dtype=np.intp)
+        best = scores[:, 0] + self.intercept_init
+
+        for i in range(1, max_len):
+            candidates = best[:, :, None] + self.intercept_trans
+            backpointers[:, i] = candidates.argmax(axis=1)
+            active = (i < lengths)[:, None]
+            best = np.where(active, candidates.max(axis=1) + scores[:, i], best)
+
+        state = (best + self.intercept_final).argmax(axis=1)
+        batch = np.arange(n_sentences)
+        paths = np.zeros((n_sentences, max_len), dtype=np.intp)
+        for i in range(max_len - 1, -1, -1):
+            inside = i < lengths
+            paths[:, i] = np.where(inside, state, 0)
+            if i:
+                state = np.where(inside, backpointers[batch, i, state], state)
+        return paths
+
+    def tag_sequences(self, sequences, batch_size=256):
+        """
+            Sentences are sorted by length and decoded in padded batches
+
+            :param sequences: list of columns sets
+            :param batch_size: sentences per batch
+            :return: list of tag arrays in the input order
+        """
+        # empty sentences get empty tag arrays and stay out of the padded batches
+        order = sorted((n for n in range(len(sequences)) if len(sequences[n])), key=lambda n: len(sequences[n]))
+        results = [self.classes[:0]] * len(sequences)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            lengths = [len(sequences[n]) for n in batch]
+            paths = self.viterbi(self.emissions([sequences[n] for n in batch]), lengths)
+            for n, path, length in zip(batch, paths, lengths):
+                results[n] = self.classes[path[:length]]
+        return results
+
+    def tag_sequence(self, sequence):
+        return self.tag_sequences([sequence])[0]
+
+    def tag_many(self, sentences, batch_size=256):
+        """
+            :param sentences: list of token lists
+            :return: list of tag lists
+        """
+        sequences = [tuple("%d\t%s" % (i, word) for i, word in enumerate(words)) for words in sentences]
+        return [tags.tolist() for tags in self.tag_sequences(sequences, batch_size)]
+
+    def tag(self, words):
+        """
+            :param words: tokens of one sentence
+            :return: list of tags
+        """
+        return self.tag_many([words])[0]
+
+    def tag_conll(self, f):
+        """
+            :param f: opened CoNLL file
+            :return: array of tags for all the tokens of the file
+        """
+        return np.concatenate(self.tag_sequences([sequence for sequence, _ in read_conll(f)]))
+
+
+def train(train_path, max_iter=50, n_features=2 ** 16, workers=None, cache_dir=None):
+    """
+        :param train_path: CoNLL file
+        :param max_iter: perceptron epochs
+        :param n_features: dimension of the hashed feature space; memory of the model and of the
+            feature matrix rows does not depend on the vocabulary of the training set
+        :param workers: feature extraction processes, see extract_features
+        :param cache_dir: feature matrix cache, see extract_features
+        :return: PosTagger
+    """
+    from seqlearn.perceptron import StructuredPerceptron
+
+    # читаем обучающее множество
+    X_train, y_train, lengths_train = extract_features(train_path, n_features, workers, cache_dir=cache_dir)
+
+    clf = StructuredPerceptron(decode="viterbi", lr_exponent=.05, max_iter=max_iter)
+
+    print("Fitting model " + str(clf))
+    clf.fit(X_train, y_train, lengths_train)
+
+    return PosTagger.from_estimator(clf, n_features)
+
+
+def evaluate(tagger, path, verbose=True):
+    """
+        :return: dict with whole sequence accuracy, element-wise accuracy and macro F1
+    """
+    from seqlearn.evaluation import whole_sequence_accuracy
+    from sklearn.metrics import accuracy_score, f1_score
+
+    with open(path, "r") as f:
+        sentences = list(read_conll(f))
+
+    y_true = np.array([label for _, labels in sentences for label in labels])
+    lengths = np.array([len(labels) for _, labels in sentences], dtype=np.int32)
+    y_pred = np.concatenate(tagger.tag_sequences([sequence for sequence, _ in sentences]))
+
+    scores = {
+        "whole_seq_accuracy": whole_sequence_accuracy(y_true, y_pred, lengths),
+        "accuracy": accuracy_score(y_true, y_pred),
+        "f1_macro": f1_score(y_true, y_pred, average="macro")
+    }
+    if verbose:
+        print("Whole seq accuracy    ", scores["whole_seq_accuracy"])
+        print("Element-wise accuracy ", scores["accuracy"])
+        print("Mean F1-score macro   ", scores["f1_macro"])
+    return scores
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='POS-tagger for Russian translit')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help='train the model, evaluate it on dev and save')
+    train_parser.add_argument('--train', default='../resources/train.data')
+    train_parser.add_argument('--dev', default='../resources/dev.data')
+    train_parser.add_argument('--model', default='pos_tagger.npz')
+    train_parser.add_argument('--max-iter', type=int, default=50)
+    train_parser.add_argument('--n-features', type=int, default=2 ** 16, help='hashed feature space dimension')
+    train_parser.add_argument('--workers', type=int, default=None, help='feature extraction processes')
+    train_parser.add_argument('--cache-dir', default='features_cache',
+                              help='extracted feature matrices cache, empty string disables it')
+
+    tag_parser = subparsers.add_parser('tag', help='tag a CoNLL file with a saved model')
+    tag_parser.add_argument('--model', default='pos_tagger.npz')
+    tag_parser.add_argument('--test', default='../resources/test.data')
+    tag_parser.add_argument('--submission', default='submission.csv')
+
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        tagger = train(args.train, args.max_iter, args.n_features, args.workers, args.cache_dir or None)
+        tagger.save(args.model)
+        print("Model saved to", args.model)
+
+        if args.dev:
+            print("\nPredictions on dev set")
+            # читаем отладочное множество
+            evaluate(tagger, args.dev)
+    else:
+        checkpoint = time.time()
+        tagger = PosTagger.load(args.model)
+        print("Model loaded in", time.time() - checkpoint)
+
+        print("\nPredictions on test set")
+
+        # читаем тестовое множество
+        with open(args.test, "r") as f:
+            y_pred = tagger.tag_conll(f)
+
+        tags, counts = np.unique(y_pred, return_counts=True)
+        for tag, count in sorted(zip(tags, counts), key=lambda pair: -pair[1]):
+            print(tag, count)
+
+        print("Saving predicted as a submission")
+
+        with open(args.submission, "w") as wf:
+            wf.write("id,tag\n")
+            for id, tag in enumerate(list(y_pred)):
+                wf.write(str(id + 1) + "," + tag + "\n")
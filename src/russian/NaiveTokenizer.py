@@ -1,38 +1,173 @@
+import io
 import re
 import string
-from collections import namedtuple
+from array import array
+from collections import deque, namedtuple
+from functools import lru_cache
+from itertools import islice
+
+from src.russian.ParallelMap import parallel_map
+from src.russian.ResourceRegistry import load_resource, resource_path
+
+# состояния автомата разбиения на токены; класс символа совпадает с состоянием, в которое он переводит
+START, CURRENCY, EOS, INS, WORD, SPACE = range(6)
+
+# действия: продолжить токен, начать новый токен, продолжить только для сокращений
+APPEND, SPLIT, ABBR = range(3)
+
+# TRANSITIONS[состояние][класс символа]
+TRANSITIONS = (
+    # START  CURRENCY  EOS     INS     WORD
+    (None, APPEND, APPEND, APPEND, APPEND),  # START
+    (None, APPEND, SPLIT, SPLIT, SPLIT),     # CURRENCY
+    (None, SPLIT, APPEND, SPLIT, SPLIT),     # EOS
+    (None, SPLIT, SPLIT, SPLIT, SPLIT),      # INS
+    (None, SPLIT, ABBR, SPLIT, APPEND),      # WORD
+)
+
+Token = namedtuple('Token', ('Value', 'Type'))
+
+# токен потоковой токенизации со смещениями в символах от начала источника
+OffsetToken = namedtuple('OffsetToken', ('Value', 'Type', 'Start', 'End'))
+
+# предложение: границы в символах и его токены
+Sentence = namedtuple('Sentence', ('Start', 'End', 'Tokens'))
+
+TOKEN_TYPES = ('WORD', 'DIGIT', 'URL', 'PUNCT', 'SYMB', 'QUOTE', 'LBR', 'RBR')
+TYPE_CODES = {token_type: code for code, token_type in enumerate(TOKEN_TYPES)}
+
+
+def trie_pattern(words):
+    """
+        Регэксп для множества строк в виде префиксного дерева: общие префиксы проверяются один раз,
+        а из нескольких подходящих строк выбирается самая длинная
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for c in word:
+            node = node.setdefault(c, {})
+        node[''] = None
+
+    def build(node):
+        leaves = [re.escape(c) for c, child in sorted(node.items()) if c and child == {'': None}]
+        branches = [re.escape(c) + build(child) for c, child in sorted(node.items()) if c and child != {'': None}]
+        if leaves:
+            branches.append(leaves[0] if len(leaves) == 1 else '[' + ''.join(leaves) + ']')
+
+        if '' in node:
+            return '(?:' + '|'.join(branches) + ')?'
+        elif len(branches) == 1:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')'
+
+    return build(trie)
+
+
+@lru_cache(maxsize=None)
+def compile_patterns(tlds):
+    """
+        URL-регэксп и регэксп фрагментов текста для списка доменов верхнего уровня,
+        компилируются один раз на процесс и общие для всех токенизаторов
+    """
+    url = r'('
+    url += r'(?:(https?|s?ftp):\/\/)?'
+    url += r'(?:www\.)?'
+    url += r'('
+    url += r'(?:(?:([A-Z0-9][A-Z0-9-_]+)@([A-Z0-9-_\.])+[A-Z0-9]\.)' \
+           r'|(?:[A-Z0-9][A-Z0-9-]{0,61}[A-Z0-9]\.)+)'
+
+    tld = r'(' + trie_pattern(tlds) + r')'
+
+    url += tld
+    url += r'|(?:\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'
+    url += r')'
+    url += r'(?::(\d{1,5}))?'
+    url += r'(?:(\/\S+[^\.\,\s]))?'
+    url += r')'
+
+    # один проход по тексту: каждое совпадение - целый фрагмент между пробелами, группа отмечает
+    # его "середину" с тем же приоритетом, что и раньше: сначала самый левый URL, затем при наличии
+    # букв и цифр - самое левое буквенно-цифровое слово, затем самое левое число
+    chunk = re.compile(
+        r'\S*?(?P<url>' + url + r')\S*'
+        r'|(?=\S*?\d)(?=\S*?[A-ZА-Я])\S*?(?P<numalpha>[/.\w-]+)\S*'
+        r'|\S*?(?P<digit>\d+(?:[.,]\d+)?)\S*'
+        r'|\S+',
+        re.IGNORECASE
+    )
+
+    return re.compile(url, re.IGNORECASE), chunk
+
+
+def read_abbreviations(f):
+    return frozenset(line.strip().lower() for line in f)
+
+
+def read_tlds(f):
+    # первые три строки файла - заголовок IANA
+    return tuple(line.strip().lower() for i, line in enumerate(f) if i > 2)
+
+
+class TokenStream(object):
+    """
+        Поток токенов в параллельных массивах: начало, конец и код типа (индекс в TOKEN_TYPES).
+        Значения токенов вырезаются из исходного текста только по запросу
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.starts = array('q')
+        self.ends = array('q')
+        self.types = array('b')
+
+    @classmethod
+    def from_arrays(cls, text, starts, ends, types):
+        stream = cls(text)
+        stream.starts, stream.ends, stream.types = starts, ends, types
+        return stream
+
+    def append(self, start, end, type_code):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.types.append(type_code)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        return Token(self.value(i), TOKEN_TYPES[self.types[i]])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def value(self, i):
+        return self.text[self.starts[i]:self.ends[i]]
+
+    def type(self, i):
+        return TOKEN_TYPES[self.types[i]]
+
+    def values(self):
+        text = self.text
+        for start, end in zip(self.starts, self.ends):
+            yield text[start:end]
+
+    def spans(self):
+        return zip(self.starts, self.ends, self.types)
 
 
 class NaiveTokenizer(object):
 
     def __init__(self):
-        with open('../russian/resources/tokenizer/abbreviations.txt', 'r') as inf:
-            self.abbr = {
-                line.strip().lower() for line in inf
-            }
-
-        with open('../russian/resources/tokenizer/tlds-alpha-by-domain.txt', 'r') as inf:
-            self.tlds = [
-                line.strip().lower() for i, line in enumerate(inf) if i > 3
-            ]
-
-        url = r'('
-        url += r'(?:(https?|s?ftp):\/\/)?'
-        url += r'(?:www\.)?'
-        url += r'('
-        url += r'(?:(?:([A-Z0-9][A-Z0-9-_]+)@([A-Z0-9-_\.])+[A-Z0-9]\.)' \
-               r'|(?:[A-Z0-9][A-Z0-9-]{0,61}[A-Z0-9]\.)+)'
-
-        tld = r'(' + r'|'.join(self.tlds) + r')'
-
-        url += tld
-        url += r'|(?:\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'
-        url += r')'
-        url += r'(?::(\d{1,5}))?'
-        url += r'(?:(\/\S+[^\.\,\s]))?'
-        url += r')'
-
-        self.URL = re.compile(url, re.IGNORECASE)
+        self.abbr = load_resource(
+            resource_path(__file__, 'resources', 'tokenizer', 'abbreviations.txt'), read_abbreviations
+        )
+        self.tlds = load_resource(
+            resource_path(__file__, 'resources', 'tokenizer', 'tlds-alpha-by-domain.txt'), read_tlds
+        )
+
+        self.URL, self.CHUNK = compile_patterns(self.tlds)
         self.CURRENCY = '$€£¢¥₽'
         self.OTHER_PUNCT = '#%^~±°'
         self.PUNCT = string.punctuation
@@ -43,136 +178,251 @@ class NaiveTokenizer(object):
         self.QUOTES = '\"\'\`«»“”‘’'
         self.LBRACKETS = '<([{'
         self.RBRACKETS = '>)]}'
+        self.PUNCT_CHARS = self.EOS + self.INS
+        self.SYMBOL_CHARS = self.CURRENCY + self.OTHER_PUNCT + self.PUNCT
+
+
+        # таблица символ -> класс, остальные символы относятся к классу WORD
+        self.char_classes = {}
+        for chars, char_class in ((self.QUOTES + self.LBRACKETS + self.RBRACKETS + self.INS, INS),
+                                  (self.EOS, EOS),
+                                  (self.CURRENCY + self.OTHER_PUNCT, CURRENCY),
+                                  (string.whitespace, SPACE)):
+            for c in chars:
+                self.char_classes.setdefault(c, char_class)
+        self.NON_WORD = re.compile('[' + re.escape(''.join(self.char_classes)) + ']')
+
+    def get_sequence(self, text, begin=0, end=None):
+        """
+            Разбиение фрагмента text[begin:end] автоматом по таблице переходов,
+            возвращает границы токенов
+        """
+        classes = self.char_classes
+        end = len(text) if end is None else end
+
+        state = START
+        token_start = begin
+        i = begin
+        while i < end:
+            char_class = classes.get(text[i], WORD)
+
+            if char_class == WORD:
+                # переходы WORD -> WORD ничего не меняют, поэтому серия букв проходится за один шаг
+                match = self.NON_WORD.search(text, i + 1, end)
+                next_i = match.start() if match else end
+            else:
+                next_i = i + 1
+
+            if char_class == SPACE:
+                if token_start < i:
+                    yield token_start, i
+                state, token_start, i = START, next_i, next_i
+                continue
+
+            action = TRANSITIONS[state][char_class]
+            if action == ABBR:
+                # точка остаётся в слове для однобуквенных слов и известных сокращений
+                action = APPEND if i - token_start <= 1 or text[token_start:i + 1].lower() in self.abbr else SPLIT
+
+            if action == SPLIT:
+                yield token_start, i
+                token_start = i
+            state, i = char_class, next_i
+
+        if token_start < end:
+            yield token_start, end
+
+    def get_type(self, value, url=True):
+        """
+            Тип токена; url=False, когда заранее известно, что в value нет URL
+        """
+        if value in self.LBRACKETS:
+            return 'LBR'
+        elif value in self.RBRACKETS:
+            return 'RBR'
+        elif value in self.QUOTES:
+            return 'QUOTE'
+        elif value in self.PUNCT_CHARS:
+            return 'PUNCT'
+        elif value in self.SYMBOL_CHARS:
+            return 'SYMB'
+        elif url and self.URL.search(value):
+            return 'URL'
+        elif self.NUMALPHA.search(value):
+            return 'WORD'
+        elif self.DIGIT.search(value):
+            return 'DIGIT'
+        else:
+            return 'WORD'
+
+    def spans(self, text):
+        """
+            Токены текста в виде троек (начало, конец, тип)
+        """
+        for chunk in self.CHUNK.finditer(text):
+            chunk_start, chunk_end = chunk.span()
+            kind = chunk.lastgroup
+
+            if kind is None:
+                for start, end in self.get_sequence(text, chunk_start, chunk_end):
+                    yield start, end, self.get_type(text[start:end], url=False)
+                continue
+
+            # до самого левого URL другого URL нет, а после - может быть
+            middle_start, middle_end = chunk.span(kind)
+            for start, end in self.get_sequence(text, chunk_start, middle_start):
+                yield start, end, self.get_type(text[start:end], url=False)
+            yield middle_start, middle_end, \
+                'URL' if kind == 'url' else self.get_type(text[middle_start:middle_end], url=False)
+            for start, end in self.get_sequence(text, middle_end, chunk_end):
+                yield start, end, self.get_type(text[start:end], url=kind == 'url')
 
     def tokenize(self, text):
-
-        def isnumalpha(s):
-            return re.search('[A-ZА-Я]', s, re.IGNORECASE) and re.search('(\d)+', s)
-
-        def get_sequence(cur_token):
-
-            START, CURRENCY, EOS, INS, WORD = range(5)
-
-            cur_tok = ''
-            state = START
-
-            for c in cur_token:
-                if c in self.QUOTES + self.LBRACKETS + self.RBRACKETS + self.INS:
-                    if state == START:
-                        state = INS
-                        cur_tok += c
-                    elif state in (EOS, INS, CURRENCY, WORD):
-                        state = INS
-                        if cur_tok:
-                            yield cur_tok
-                            cur_tok = c
-                    else:
-                        state = INS
-                        cur_tok += c
-                elif c in self.EOS:
-                    if state == START:
-                        state = EOS
-                        cur_tok += c
-                    elif state == EOS:
-                        cur_tok += c
-                    elif state in (INS, CURRENCY):
-                        state = EOS
-                        if cur_tok:
-                            yield cur_tok
-                            cur_tok = c
-                    elif state == WORD:
-                        state = EOS
-                        if cur_tok and ((cur_tok + c).lower() in self.abbr or len(cur_tok) <= 1):
-                            cur_tok += c
-                        else:
-                            yield cur_tok
-                            cur_tok = c
-                    else:
-                        state = EOS
-                        cur_tok += c
-                elif c in self.CURRENCY or c in self.OTHER_PUNCT:
-                    if state == START:
-                        state = CURRENCY
-                        cur_tok += c
-                    elif state == CURRENCY:
-                        cur_tok += c
-                    elif state in (EOS, INS, WORD):
-                        state = CURRENCY
-                        if cur_tok:
-                            yield cur_tok
-                            cur_tok = c
-                    else:
-                        state = CURRENCY
-                        cur_tok += c
-                elif c.isspace():
-                    if cur_tok:
-                        yield cur_tok
-                else:
-                    if state == START:
-                        state = WORD
-                        cur_tok += c
-                    elif state in (EOS, INS, CURRENCY):
-                        state = WORD
-                        if cur_tok:
-                            yield cur_tok
-                            cur_tok = c
-                    elif state == WORD:
-                        cur_tok += c
-                    else:
-                        state = WORD
-                        cur_tok += c
-
-            if cur_tok:
-                yield cur_tok
-
-        def put_token(value):
-            token = namedtuple('Token', ('Value', 'Type'))
-            if value in self.LBRACKETS:
-                return token(value, 'LBR')
-            elif value in self.RBRACKETS:
-                return token(value, 'RBR')
-            elif value in self.QUOTES:
-                return token(value, 'QUOTE')
-            elif value in self.EOS + self.INS:
-                return token(value, 'PUNCT')
-            elif value in self.CURRENCY + self.OTHER_PUNCT + self.PUNCT:
-                return token(value, 'SYMB')
-            elif self.URL.search(value):
-                return token(value, 'URL')
-            elif self.NUMALPHA.search(value):
-                return token(value, 'WORD')
-            elif self.DIGIT.search(value):
-                return token(value, 'DIGIT')
-            else:
-                return token(value, 'WORD')
-
-        for excpected_token in text.split():
-            if self.URL.search(excpected_token) or self.DIGIT.search(excpected_token):
-                if self.URL.search(excpected_token):
-                    start, end = self.URL.search(excpected_token).start(), self.URL.search(excpected_token).end()
-                elif not isnumalpha(excpected_token):
-                    start, end = self.DIGIT.search(excpected_token).start(), \
-                                 self.DIGIT.search(excpected_token).end()
-                else:
-                    start, end = self.NUMALPHA.search(excpected_token).start(), \
-                                 self.NUMALPHA.search(excpected_token).end()
-                first, middile, last = excpected_token[:start], excpected_token[start:end], excpected_token[end:]
-                if first:
-                    for tok in get_sequence(first):
-                        yield put_token(tok)
-                yield put_token(middile)
-                if last:
-                    for tok in get_sequence(last):
-                        yield put_token(tok)
-            else:
-                for tok in get_sequence(excpected_token):
-                    yield put_token(tok)
+        for start, end, token_type in self.spans(text):
+            yield Token(text[start:end], token_type)
+
+    def tokenize_spans(self, text):
+        """
+            Токенизация в компактный поток TokenStream без создания объекта на каждый токен
+        """
+        stream = TokenStream(text)
+        for start, end, token_type in self.spans(text):
+            stream.append(start, end, TYPE_CODES[token_type])
+        return stream
+
+    def tokenize_stream(self, source, buffer_size=1 << 16):
+        """
+            Потоковая токенизация в ограниченной памяти.
+            Токен не может содержать пробельных символов, поэтому буфер режется по последнему из них
+            и хвост после него переносится в следующий блок
+            :param source: текстовый файл (читается блоками по buffer_size символов)
+                или итератор строк, которые склеиваются как есть
+            :return: генератор OffsetToken со смещениями от начала источника
+        """
+        read = getattr(source, 'read', None)
+        blocks = iter(lambda: read(buffer_size), '') if read else iter(source)
+
+        offset, rest = 0, ''
+        for block in blocks:
+            cut = len(block)
+            while cut and not block[cut - 1].isspace():
+                cut -= 1
+            if not cut:
+                rest += block
+                continue
+
+            text = rest + block[:cut]
+            for start, end, token_type in self.spans(text):
+                yield OffsetToken(text[start:end], token_type, offset + start, offset + end)
+            offset += len(text)
+            rest = block[cut:]
+
+        for start, end, token_type in self.spans(rest):
+            yield OffsetToken(rest[start:end], token_type, offset + start, offset + end)
+
+    def is_sentence_end(self, token):
+        """
+            Может ли токен завершать предложение: знаки конца предложения ('.', '?!', '...')
+            или слово с точкой, которое не является сокращением или инициалом
+        """
+        value = token.Value
+        if not value.strip(self.EOS):
+            return True
+        return token.Type == 'WORD' and value[-1] == '.' and value.lower() not in self.abbr \
+            and not (len(value) == 2 and value[0].isupper())
+
+    def split_sentences(self, tokens):
+        """
+            Ленивое разбиение потока OffsetToken (например, из tokenize_stream) на предложения.
+            Закрывающие скобки и прилегающие кавычки после конца предложения остаются в нём,
+            а граница не ставится, если следующее слово начинается со строчной буквы
+            :return: генератор Sentence
+        """
+        sentence = []
+        closed = False
+        for token in tokens:
+            if closed:
+                if token.Type == 'RBR' or token.Type == 'QUOTE' and token.Start == sentence[-1].End:
+                    sentence.append(token)
+                    continue
+                if not token.Value[0].islower():
+                    yield Sentence(sentence[0].Start, sentence[-1].End, sentence)
+                    sentence = []
+
+            sentence.append(token)
+            closed = self.is_sentence_end(token)
+
+        if sentence:
+            yield Sentence(sentence[0].Start, sentence[-1].End, sentence)
+
+    def sentences(self, text):
+        return self.split_sentences(self.tokenize_stream((text,)))
+
+
+_worker_tokenizer = None
+
+
+def _init_worker():
+    global _worker_tokenizer
+    _worker_tokenizer = NaiveTokenizer()
+
+
+def _tokenize_batch(docs):
+    # текст документов уже есть у вызывающего процесса, назад передаются только массивы
+    result = []
+    for doc in docs:
+        stream = _worker_tokenizer.tokenize_spans(doc)
+        result.append((stream.starts, stream.ends, stream.types))
+    return result
+
+
+def tokenize_many(docs, workers=None, chunksize=256):
+    """
+        Токенизация множества документов пулом процессов с сохранением порядка
+        :param docs: итерируемая коллекция строк
+        :param workers: число процессов, по умолчанию - число ядер; при 1 пул не создаётся
+        :param chunksize: число документов в одном задании пула
+        :return: генератор TokenStream в порядке входных документов
+    """
+    docs = iter(docs)
+    # пачки, отправленные в пул, но ещё не выданные; parallel_map держит их не больше 4 на процесс
+    pending = deque()
+
+    def batches():
+        for batch in iter(lambda: list(islice(docs, chunksize)), []):
+            pending.append(batch)
+            yield batch
+
+    for arrays in parallel_map(_tokenize_batch, batches(), workers, initializer=_init_worker):
+        for doc, (starts, ends, types) in zip(pending.popleft(), arrays):
+            yield TokenStream.from_arrays(doc, starts, ends, types)
 
 
 if __name__ == '__main__':
     tokenizer = NaiveTokenizer()
     # print(list(tokenizer.tokenize('2 + 2 = 4, а 2*2 == 5!')))
 
+    stream = tokenizer.tokenize_spans('Нефть за $27/барр. обеспечена!')
+    assert list(stream.values()) == ['Нефть', 'за', '$', '27/барр.', 'обеспечена', '!']
+    assert list(stream.starts) == [0, 6, 9, 10, 19, 29] and stream.type(2) == 'SYMB'
+    assert stream[5] == ('!', 'PUNCT')
+
+    text = 'Нефть стоит $50,67. См. facebook.com/zebrochka\nВ г. Санкт-Петербург дожди!'
+    assert [(token.Value, token.Type) for token in tokenizer.tokenize_stream(io.StringIO(text), buffer_size=7)] == \
+        list(tokenizer.tokenize(text))
+    assert all(text[token.Start:token.End] == token.Value
+               for token in tokenizer.tokenize_stream(text.splitlines(keepends=True)))
+
+    text = 'Он сказал: «Привет!» И ушёл... и не вернулся. Это я. А. С. Пушкин жил в г. Москве (недолго.) Конец'
+    assert [text[sentence.Start:sentence.End] for sentence in tokenizer.sentences(text)] == [
+        'Он сказал: «Привет!»', 'И ушёл... и не вернулся.', 'Это я.',
+        'А. С. Пушкин жил в г. Москве (недолго.)', 'Конец'
+    ]
+
+    docs = ['Нефть стоит $50,67.', 'В г. Санкт-Петербург дожди!', ''] * 7
+    assert [list(s) for s in tokenize_many(docs, workers=2, chunksize=4)] == \
+        [list(tokenizer.tokenize(doc)) for doc in docs]
+
     assert [token.Value for token in list(tokenizer.tokenize(
         'Спешите приобрести последние автомобили Volvo XS60!'
     ))] == ['Спешите', 'приобрести', 'последние', 'автомобили', 'Volvo', 'XS60', '!']
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+    Упорядоченный map пулом процессов для потоковых данных: задания забираются из входа только
+    по мере выдачи результатов, поэтому память не растёт с длиной входа
+"""
+import os
+from collections import deque
+
+
+def parallel_map(function, tasks, workers=None, initializer=None, initargs=(), window=4):
+    """
+        :param function: функция уровня модуля от одного задания
+        :param tasks: итерируемая коллекция заданий, может быть генератором
+        :param workers: число процессов, по умолчанию - число ядер; при 1 пул не создаётся
+        :param initializer: функция, один раз вызываемая в каждом процессе с аргументами initargs
+        :param window: сколько заданий на процесс одновременно находится в работе
+        :return: генератор результатов в порядке заданий
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for task in tasks:
+            yield function(task)
+        return
+
+    # Pool.imap забирает задания из входа в отдельном потоке независимо от потребителя,
+    # поэтому задания отправляются вручную и в работе их не больше window * workers
+    from multiprocessing import Pool
+
+    with Pool(workers, initializer=initializer, initargs=initargs) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(function, (task,)))
+            if len(pending) >= window * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
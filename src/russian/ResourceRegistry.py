@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+    Общий реестр ресурсных файлов: пути считаются относительно модуля-владельца,
+    а не рабочего каталога, и каждый файл читается один раз на процесс.
+    Загруженные ресурсы неизменяемы (frozenset, tuple) и общие для всех экземпляров
+"""
+import os
+import threading
+
+_resources = {}
+_lock = threading.Lock()
+
+
+def resource_path(anchor, *parts):
+    """
+        Путь к ресурсу относительно каталога модуля anchor (обычно __file__)
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(anchor)), *parts)
+
+
+def read_lines(f):
+    return tuple(line.strip() for line in f)
+
+
+def read_set(f):
+    return frozenset(line.strip() for line in f)
+
+
+def load_resource(path, loader=read_lines):
+    """
+        Ресурс, прочитанный функцией loader(file) при первом обращении.
+        loader должен быть функцией уровня модуля: он входит в ключ кэша
+    """
+    key = (os.path.abspath(path), loader)
+    if key not in _resources:
+        with _lock:
+            if key not in _resources:
+                with open(path, 'r', encoding='utf-8') as f:
+                    _resources[key] = loader(f)
+    return _resources[key]
@@ -4,8 +4,9 @@
 """
 import codecs
 import csv
+import heapq
 import time
-from collections import Counter, defaultdict
+from collections import Counter, defaultdict, namedtuple
 from pyxdameraulevenshtein import damerau_levenshtein_distance
 from functools import lru_cache
 
@@ -21,6 +22,8 @@ import string
 nltk.download('stopwords')
 all_stopwords = stopwords.words('russian') + stopwords.words('english')
 
+Suggestion = namedtuple('Suggestion', ('word', 'distance', 'frequency', 'overlap'))
+
 
 class StatisticalSpeller(object):
     """
@@ -32,20 +35,37 @@ class StatisticalSpeller(object):
     def tokenize(text):
         return [t for t in text.split()]
 
-    def __init__(self, n_candidates_search=150):
+    def __init__(self, n_candidates_search=150, max_distance=5, compaction_ratio=0.25):
         """
         :param n_candidates_search: число кандидатов-строк при поиске
+        :param max_distance: максимальное расстояние Дамерау-Левенштейна до исправления
+        :param compaction_ratio: доля удалённых слов, после которой идентификаторы термов перенумеровываются
         """
         self.n_candidates = n_candidates_search
+        self.max_distance = max_distance
+        self.compaction_ratio = compaction_ratio
         self.morph = pymorphy2.MorphAnalyzer()
 
         # векторайзеры для нграмного индекса и частотного словаря
         self.vectorizer = CountVectorizer(analyzer="char_wb", ngram_range=(2, 3), binary=True)
         self.voc_vectorizer = CountVectorizer(tokenizer=self.tokenize)
+        self.voc_analyzer = self.voc_vectorizer.build_analyzer()
 
-        # нграмный индекс + частотный словарь по корпусу текстов
-        self.index = defaultdict(set)
+        # нграмный индекс (нграмма -> длина слова -> термы) + частотный словарь по корпусу текстов
+        # и частоты, добавленные через add_words: они хранятся по токенам, а не по идентификаторам
+        # векторайзера, поэтому переживают повторную подгонку fit_texts
+        self.index = defaultdict(dict)
         self.voc = defaultdict(int)
+        self.added_voc = Counter()
+
+        # словарь термов: идентификатор -> слово (None для удалённых) и обратное отображение
+        self.words_list = []
+        self.word_ids = {}
+        self.n_deleted = 0
+
+        # счётчики поиска кандидатов: сколько совпадений по нграммам посчитано,
+        # для скольких кандидатов посчитано расстояние и сколько из них прошли фильтр
+        self.stats = Counter()
 
         # регэкспы для битых предлогов
         self.on_prep = re.compile(r'\b(н{2,}а|на{2,})\b')
@@ -57,31 +77,136 @@ class StatisticalSpeller(object):
         """
 
         checkpoint = time.time()
-        self.words_list = words_list
+        # повторная подгонка перенумеровывает и нграммы, и термы, старый индекс выбрасывается
+        self.index = defaultdict(dict)
+        self.words_list = list(words_list)
+        self.word_ids = {word: word_id for word_id, word in enumerate(self.words_list)}
+        self.n_deleted = 0
 
         encoded_words = self.vectorizer.fit_transform(words_list).tocoo()
 
-        # строим словарь, отображающий идентификатор нграммы в множество термов
+        # строим словарь, отображающий идентификатор нграммы в множества термов,
+        # разбитые по длине слова: расстояние между словами не меньше разницы их длин,
+        # поэтому при поиске достаточно смотреть корзины в пределах max_distance от длины запроса
         for i in zip(encoded_words.row, encoded_words.col):
-            self.index[i[1]].add(i[0])
+            self.index[i[1]].setdefault(len(words_list[i[0]]), set()).add(i[0])
 
         print("Speller fitted in", time.time() - checkpoint)
 
+        self.rectify.cache_clear()
         return self
 
     def fit_texts(self, texts):
         checkpoint = time.time()
         words_vocab = self.voc_vectorizer.fit_transform(texts).tocoo()
 
+        # идентификаторы токенов перенумерованы, старые счётчики к ним не относятся
+        self.voc = defaultdict(int)
+
         for itup in zip(words_vocab.row, words_vocab.col):
             self.voc[itup[1]] += 1
 
         print("Speller fitted for texts in", time.time() - checkpoint)
 
-    @lru_cache(maxsize=1000000)
-    def rectify(self, word):
+        self.rectify.cache_clear()
+
+    def add_words(self, words, frequencies=None):
         """
-            Предсказания спеллера
+            Добавление слов в обученный спеллер без повторной подгонки
+
+            :param words: новые слова
+            :param frequencies: словарь слово -> частота для частотного словаря
+        """
+        analyzer = self.vectorizer.build_analyzer()
+        vocabulary = self.vectorizer.vocabulary_
+
+        for word in words:
+            if word in self.word_ids:
+                continue
+
+            word_id = len(self.words_list)
+            self.words_list.append(word)
+            self.word_ids[word] = word_id
+
+            # нграммы, которых не было при подгонке, получают новые идентификаторы
+            for ngram in set(analyzer(word)):
+                ngram_id = vocabulary.setdefault(ngram, len(vocabulary))
+                self.index[ngram_id].setdefault(len(word), set()).add(word_id)
+
+        if frequencies:
+            for word, frequency in frequencies.items():
+                for token in self.voc_analyzer(word):
+                    self.added_voc[token] += frequency
+
+        self.rectify.cache_clear()
+
+    def remove_words(self, words):
+        """
+            Удаление слов из обученного спеллера: термы убираются из индекса,
+            а их идентификаторы освобождаются при уплотнении
+        """
+        analyzer = self.vectorizer.build_analyzer()
+        vocabulary = self.vectorizer.vocabulary_
+
+        for word in words:
+            word_id = self.word_ids.pop(word, None)
+            if word_id is None:
+                continue
+
+            for ngram in set(analyzer(word)):
+                buckets = self.index.get(vocabulary.get(ngram))
+                if buckets and len(word) in buckets:
+                    buckets[len(word)].discard(word_id)
+
+            self.words_list[word_id] = None
+            self.n_deleted += 1
+
+        if self.n_deleted > self.compaction_ratio * len(self.words_list):
+            self.compact()
+
+        self.rectify.cache_clear()
+
+    def compact(self):
+        """
+            Перенумерация термов после удалений: пустые корзины индекса выбрасываются
+        """
+        mapping = {}
+        words_list = []
+        for word_id, word in enumerate(self.words_list):
+            if word is not None:
+                mapping[word_id] = len(words_list)
+                words_list.append(word)
+
+        index = defaultdict(dict)
+        for ngram_id, buckets in self.index.items():
+            for length, word_ids in buckets.items():
+                if word_ids:
+                    index[ngram_id][length] = {mapping[word_id] for word_id in word_ids}
+
+        self.index = index
+        self.words_list = words_list
+        self.word_ids = {word: word_id for word_id, word in enumerate(words_list)}
+        self.n_deleted = 0
+
+        self.rectify.cache_clear()
+
+    def word_frequency(self, word):
+        """
+            Частота слова по частотному словарю корпуса текстов,
+            0 если спеллер не обучался на текстах
+        """
+        vocabulary = getattr(self.voc_vectorizer, 'vocabulary_', {})
+        tokens = self.voc_analyzer(word)
+        if not tokens:
+            return 0
+
+        known = [token for token in tokens if token in vocabulary]
+        token = min(known, key=vocabulary.get) if known else tokens[0]
+        return (self.voc[vocabulary[token]] if known else 0) + self.added_voc[token]
+
+    def candidates(self, word):
+        """
+            Кандидаты-исправления в пределах max_distance в порядке убывания числа общих нграмм
         """
 
         # запрос, преобразованный в нграммы
@@ -93,31 +218,63 @@ class StatisticalSpeller(object):
         # для каждого терма считаем совпадение по нграммам
         counter = Counter()
 
+        lengths = range(max(len(word) - self.max_distance, 1), len(word) + self.max_distance + 1)
         for token_id in char_ngrams_list:
-            for word_id in self.index[token_id]:
-                counter[word_id] += 1
+            buckets = self.index.get(token_id)
+            if not buckets:
+                continue
+            for length in lengths:
+                word_ids = buckets.get(length)
+                if word_ids:
+                    counter.update(word_ids)
+                    self.stats['scanned'] += len(word_ids)
+
+        # среди топа по совпадениям по нграммам оставляем близкие
+        # по модифицированному расстоянию Левенштейна (с перестановками)
+        for word_id, overlap in counter.most_common(n=self.n_candidates):
+            sugg = self.words_list[word_id]
+            dl_distance = damerau_levenshtein_distance(sugg, word)
+            self.stats['candidates'] += 1
+            if dl_distance <= self.max_distance:
+                self.stats['accepted'] += 1
+                yield Suggestion(sugg, dl_distance, self.word_frequency(sugg), overlap)
 
-        # среди топа по совпадениям по нграммам ищем "хорошее" исправление
+    def suggest(self, word, k=5):
+        """
+            Топ-k исправлений с оценками: расстояние, частота и число общих нграмм
+        """
+        return heapq.nsmallest(k, self.candidates(word),
+                               key=lambda sugg: (sugg.distance, -sugg.frequency, -sugg.overlap))
 
-        # используем модифицированное расстояние Левенштейна (с перестановками)
-        # а также ищем слово с минимальным количеством новых букв
-        suggests = list()
-        for suggest in counter.most_common(n=self.n_candidates):
-            sugg = self.words_list[suggest[0]]
-            dl_distance = damerau_levenshtein_distance(sugg, word)
-            fitted_sugg_list = self.voc_vectorizer.transform([sugg]).tocoo().col
-            if dl_distance <= 5:
-                suggests.append((sugg, dl_distance, self.voc[fitted_sugg_list[0]] if fitted_sugg_list else 0))
+    @lru_cache(maxsize=1000000)
+    def rectify(self, word):
+        """
+            Предсказания спеллера
+        """
+
+        # среди кандидатов с минимальным расстоянием ищем самое частое слово
+        # из тех же букв (перестановка), иначе берём первого из ближайших
+        letters = set(word)
+        nearest, swap = None, None
+        for sugg in self.candidates(word):
+            if nearest is None or sugg.distance < nearest.distance:
+                nearest, swap = sugg, None
+            if sugg.distance == nearest.distance and set(sugg.word) == letters \
+                    and (swap is None or sugg.frequency > swap.frequency):
+                swap = sugg
 
-        suggests = sorted(suggests, key=lambda tup: tup[1])
+        if nearest is None:
+            return word
 
-        minimal_distance = min([suggest[1] for suggest in suggests])
-        swap_words = sorted(
-            [(suggest[0], suggest[2]) for suggest in suggests
-             if suggest[1] == minimal_distance and set(suggest[0]) == set(word)],
-            key=lambda tup: -tup[1])
+        return swap.word if swap and swap.frequency > 0 else nearest.word
 
-        return swap_words[0][0] if swap_words and swap_words[0][1] > 0 else suggests[0][0]
+    def rectify_many(self, words):
+        """
+            Предсказания спеллера для пачки слов,
+            повторяющиеся слова исправляются один раз
+        """
+        rectified = {word: self.rectify(word) for word in set(words)}
+        return [rectified[word] for word in words]
 
     # ищем тег среди разборов одного слова
     def tag_in_parse(self, tag_name, word):
@@ -326,6 +483,24 @@ if __name__ == "__main__":
 
     np.random.seed(0)
 
+    # полная переподгонка после инкрементальных изменений даёт тот же индекс, что и новый спеллер
+    sample = ['молоко', 'молот', 'колокол', 'сорока', 'корова', 'ворона', 'водопад', 'пароход', 'самолёт', 'солома']
+    refitted = StatisticalSpeller().fit(sample[:5])
+    refitted.add_words(sample[5:])
+    refitted.remove_words(sample[:2])
+    refitted.fit(sample)
+    fresh = StatisticalSpeller().fit(sample)
+    for typo in ['малоко', 'калокол', 'сарока', 'карова', 'варона', 'вадопад', 'парахот', 'самалёт', 'салома']:
+        assert sorted(refitted.candidates(typo)) == sorted(fresh.candidates(typo)), typo
+        assert refitted.rectify(typo) == fresh.rectify(typo), typo
+
+    # частоты из add_words не смешиваются с частотным словарём, построенным позже
+    frequent = StatisticalSpeller().fit(['молоко', 'малина'])
+    frequent.add_words(['малинка'], {'малинка': 5})
+    assert frequent.word_frequency('малинка') == 5 and frequent.word_frequency('малина') == 0
+    frequent.fit_texts(['молоко малина', 'молоко'])
+    assert [frequent.word_frequency(word) for word in ('молоко', 'малина', 'малинка')] == [2, 1, 5]
+
     # зачитываем словарь "правильных слов"
     words_set = set(line.strip() for line in codecs.open("../resources/words_dict.txt", "r", encoding="utf-8"))
     words_list = sorted(list(words_set))
@@ -389,6 +564,8 @@ if __name__ == "__main__":
 
     print("elapsed", checkpoint2 - checkpoint1)
     print("average speller time", total_rectification_time / float(total_sentences_rectifications))
+    print("n-gram matches scanned", speller.stats['scanned'])
+    print("candidates hit rate", speller.stats['accepted'] / float(max(speller.stats['candidates'], 1)))
 
     submission = pd.DataFrame({"id": df["id"], "text": y_submission}, columns=["id", "text"])
     submission.to_csv("baseline_submission.csv", index=None, encoding="utf-8", quotechar='"',
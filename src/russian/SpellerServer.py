@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+    Локальный HTTP-сервис спеллера (TCP или Unix-сокет).
+    Спеллер обучается один раз на процесс, одиночные запросы
+    склеиваются в пачки для StatisticalSpeller.rectify_many
+
+    GET /rectify?word=...  -> {"word": ..., "rectified": ...}
+    GET /metrics           -> гистограммы задержек и размеров пачек
+
+    python -m src.russian.SpellerServer --words words.txt [--texts texts.csv]
+    python -m src.russian.SpellerServer --self-check
+"""
+import argparse
+import asyncio
+import bisect
+import codecs
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+
+class ServiceOverloaded(Exception):
+    pass
+
+
+class Histogram(object):
+    """
+        Гистограмма с фиксированными верхними границами корзин,
+        по умолчанию - задержки в секундах
+    """
+
+    LATENCY_BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def to_dict(self):
+        labels = [str(bound) for bound in self.bounds] + ['+Inf']
+        return {
+            'buckets': dict(zip(labels, self.counts)),
+            'count': self.count,
+            'sum': self.total
+        }
+
+
+class SpellerService(object):
+    """
+        Очередь запросов к спеллеру с микро-пакетированием:
+        запросы, пришедшие в течение max_delay секунд, исправляются одним вызовом rectify_many
+    """
+
+    def __init__(self, speller, max_batch=64, max_delay=0.005, max_queue=1024, enqueue_timeout=1.0):
+        """
+        :param speller: объект с методом rectify_many(words)
+        :param max_batch: максимальный размер пачки
+        :param max_delay: сколько ждать добора пачки после первого запроса
+        :param max_queue: размер очереди, при переполнении запросы ждут места
+        :param enqueue_timeout: сколько запрос может ждать места в очереди, прежде чем получить отказ
+        """
+        self.speller = speller
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.enqueue_timeout = enqueue_timeout
+
+        self.queue = None
+        self.worker = None
+        # спеллер вызывается из одного потока, чтобы не блокировать цикл событий
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+        self.latency = Histogram()
+        self.batch_latency = Histogram()
+        self.batch_sizes = Histogram(bounds=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+        self.rejected = 0
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self.worker = asyncio.ensure_future(self.batch_loop())
+
+    async def stop(self):
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+        self.executor.shutdown()
+
+    async def rectify(self, word):
+        start = time.perf_counter()
+        future = asyncio.get_event_loop().create_future()
+
+        try:
+            await asyncio.wait_for(self.queue.put((word, future)), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ServiceOverloaded()
+
+        result = await future
+        self.latency.observe(time.perf_counter() - start)
+        return result
+
+    async def next_batch(self):
+        loop = asyncio.get_event_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_delay
+
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+
+            # отменённый get не забирает элемент из очереди, поэтому запросы не теряются
+            getter = asyncio.ensure_future(self.queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if getter in done:
+                batch.append(getter.result())
+            else:
+                getter.cancel()
+                break
+
+        return batch
+
+    async def batch_loop(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = await self.next_batch()
+            words = [word for word, _ in batch]
+
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self.executor, self.speller.rectify_many, words)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batch_latency.observe(time.perf_counter() - start)
+            self.batch_sizes.observe(len(batch))
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def metrics(self):
+        return {
+            'latency': self.latency.to_dict(),
+            'batch_latency': self.batch_latency.to_dict(),
+            'batch_size': self.batch_sizes.to_dict(),
+            'queue_size': self.queue.qsize() if self.queue else 0,
+            'rejected': self.rejected
+        }
+
+
+class SpellerServer(object):
+    """
+        Минимальный HTTP/1.0 поверх asyncio: одно соединение - один запрос
+    """
+
+    REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+               500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+    def __init__(self, service):
+        self.service = service
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8080, path=None):
+        await self.service.start()
+        if path:
+            self.server = await asyncio.start_unix_server(self.handle, path=path)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.service.stop()
+
+    async def dispatch(self, method, target):
+        url = urlsplit(target)
+
+        if method != 'GET':
+            return 400, {'error': 'only GET is supported'}
+
+        if url.path == '/rectify':
+            words = parse_qs(url.query).get('word')
+            if not words:
+                return 400, {'error': 'missing "word" parameter'}
+            try:
+                return 200, {'word': words[0], 'rectified': await self.service.rectify(words[0])}
+            except ServiceOverloaded:
+                return 503, {'error': 'queue is full'}
+            except Exception as e:
+                return 500, {'error': str(e)}
+        elif url.path == '/metrics':
+            return 200, self.service.metrics()
+        else:
+            return 404, {'error': 'unknown path'}
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin-1')
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+
+            parts = request_line.split()
+            if len(parts) < 2:
+                status, payload = 400, {'error': 'malformed request'}
+            else:
+                status, payload = await self.dispatch(parts[0], parts[1])
+
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            writer.write(('HTTP/1.0 {} {}\r\n'
+                          'Content-Type: application/json; charset=utf-8\r\n'
+                          'Content-Length: {}\r\n'
+                          'Connection: close\r\n\r\n').format(status, self.REASONS[status], len(body)).encode('latin-1'))
+            writer.write(body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+class StubSpeller(object):
+    """
+        Спеллер для офлайн-проверки сервиса: запоминает пачки и переводит слова в верхний регистр,
+        пока release не установлен, вызов rectify_many блокируется
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def rectify_many(self, words):
+        self.release.wait()
+        self.batches.append(list(words))
+        return [word.upper() for word in words]
+
+
+async def http_get(port, target):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write('GET {} HTTP/1.0\r\n\r\n'.format(target).encode('latin-1'))
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, body = response.split(b'\r\n\r\n', 1)
+    return int(head.split()[1]), json.loads(body.decode('utf-8'))
+
+
+async def self_check():
+    """
+        Проверка сервиса без спеллера и внешней сети: пакетирование, отказ при полной очереди, ошибки запросов
+    """
+    speller = StubSpeller()
+    server = SpellerServer(SpellerService(speller, max_batch=8, max_delay=0.05))
+    await server.start(port=0)
+    port = server.server.sockets[0].getsockname()[1]
+
+    # одновременные запросы исправляются одним вызовом rectify_many
+    results = await asyncio.gather(*(server.service.rectify(word) for word in 'abcdefgh'))
+    assert results == list('ABCDEFGH') and speller.batches == [list('abcdefgh')]
+
+    assert await http_get(port, '/rectify?word=%D1%91%D0%B6') == (200, {'word': 'ёж', 'rectified': 'ЁЖ'})
+    assert (await http_get(port, '/rectify'))[0] == 400
+    assert (await http_get(port, '/unknown'))[0] == 404
+    assert (await server.dispatch('POST', '/rectify?word=a'))[0] == 400
+    assert (await http_get(port, '/metrics'))[1]['batch_size']['count'] == 2
+    await server.stop()
+
+    # спеллер занят первой пачкой, вторая заполняет очередь, третий запрос получает отказ
+    speller = StubSpeller()
+    speller.release.clear()
+    server = SpellerServer(SpellerService(speller, max_batch=1, max_queue=1, enqueue_timeout=0.05))
+    await server.start(port=0)
+    first = asyncio.ensure_future(server.service.rectify('a'))
+    await asyncio.sleep(0.05)
+    second = asyncio.ensure_future(server.service.rectify('b'))
+    await asyncio.sleep(0)
+    assert await server.dispatch('GET', '/rectify?word=c') == (503, {'error': 'queue is full'})
+    assert server.service.metrics()['rejected'] == 1
+
+    speller.release.set()
+    assert [await first, await second] == ['A', 'B']
+    await server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local speller service')
+    parser.add_argument('--words', help='dictionary of correct words, one per line')
+    parser.add_argument('--texts', help='csv with "text" column for the frequency dictionary')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', help='listen on a unix socket instead of TCP')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-delay', type=float, default=0.005)
+    parser.add_argument('--max-queue', type=int, default=1024)
+    parser.add_argument('--self-check', action='store_true', help='check the service with a stub speller and exit')
+    args = parser.parse_args()
+
+    if args.self_check:
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(self_check())
+        loop.close()
+        print("Self-check passed")
+        raise SystemExit(0)
+
+    if not args.words:
+        parser.error('--words is required')
+
+    # тяжёлые зависимости спеллера нужны только при реальном запуске сервиса
+    from src.russian.SpellChecker import StatisticalSpeller
+
+    words_set = set(line.strip() for line in codecs.open(args.words, "r", encoding="utf-8"))
+    speller = StatisticalSpeller().fit(sorted(words_set))
+
+    if args.texts:
+        import pandas as pd
+        speller.fit_texts(list(pd.read_csv(args.texts)["text"]))
+
+    server = SpellerServer(SpellerService(speller, max_batch=args.max_batch,
+                                          max_delay=args.max_delay, max_queue=args.max_queue))
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(server.start(args.host, args.port, args.unix))
+    print("Speller is serving on", args.unix or "{}:{}".format(args.host, args.port))
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.stop())
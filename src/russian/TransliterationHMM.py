@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+    HMM-режим обратной транслитерации (латиница -> кириллица).
+    Скрытое состояние - последняя выписанная кириллическая буква, наблюдения - латинские сочетания
+    из таблицы фонем Transliterator. Вероятности эмиссий берутся из таблицы фонем, переходы -
+    сглаженные биграммы букв кириллического корпуса. Декодирование - алгоритм Витерби в логарифмах:
+    все слова пачки продвигаются по позициям одновременно матричными операциями numpy,
+    на каждой позиции остаются только beam лучших состояний
+"""
+import math
+import re
+
+import numpy as np
+
+from src.russian.ResourceRegistry import load_resource, resource_path
+
+ALPHABET = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+BOUNDARY = len(ALPHABET)
+N_STATES = len(ALPHABET) + 1
+STATE_IDS = {char: i for i, char in enumerate(ALPHABET)}
+
+# дополнительные прочтения, которых нет в таблице фонем, и штраф за них
+EXTRA_READINGS = {
+    'e': ('е', 'э'),
+    'i': ('й',),
+    'y': ('й',),
+    'c': ('к',),
+    'ij': ('ий', 'ый'),
+    'iy': ('ий', 'ый'),
+    'yi': ('ый', 'ий'),
+}
+EXTRA_PENALTY = math.log(0.2)
+
+
+class TransliterationHMM(object):
+
+    def __init__(self, transliterator, beam=8, smoothing=0.1, batch_size=512):
+        """
+        :param transliterator: Transliterator, из таблиц которого строятся эмиссии
+        :param beam: сколько лучших состояний сохраняется на каждой позиции
+        :param smoothing: аддитивное сглаживание биграмм
+        :param batch_size: сколько слов декодируется одновременно
+        """
+        self.beam = beam
+        self.match_case = transliterator.match_case
+        self.smoothing = smoothing
+        self.batch_size = batch_size
+        self.transitions = None
+
+        readings = {}
+
+        def add(gram, output, log_prob):
+            output = output.replace('e', 'е')
+            if all(char in STATE_IDS for char in output):
+                readings.setdefault(gram, {})
+                readings[gram][output] = max(readings[gram].get(output, -np.inf), log_prob)
+
+        for cyrillic, variants in transliterator.PHONEMES.items():
+            if cyrillic.islower():
+                for variant in variants:
+                    add(variant, cyrillic, -math.log(len(variants)))
+        for gram, output in transliterator.inverted_phonemes.items():
+            if gram.islower():
+                add(gram, ''.join(output), 0.0)
+        for gram, output in transliterator.COMBINATED_PHONEMES.items():
+            add(gram, output, EXTRA_PENALTY)
+        for gram in transliterator.IOTATED:
+            if gram.islower():
+                add(gram, 'ъ' + transliterator.inverted_phonemes[gram].replace('e', 'е'), EXTRA_PENALTY)
+        for gram, outputs in EXTRA_READINGS.items():
+            for output in outputs:
+                add(gram, output, EXTRA_PENALTY)
+
+        self.readings = readings
+        self.max_gram = max(len(gram) for gram in readings)
+        self.LATIN_RUN = re.compile('[' + re.escape(''.join(gram for gram in readings if len(gram) == 1)) + ']+',
+                                    re.IGNORECASE)
+
+        # у каждого прочтения: первая буква, последняя буква, вес эмиссии и список (граммы -> номера прочтений)
+        self.outputs = []
+        self.gram_readings = {}
+        emissions = []
+        for gram, outputs in readings.items():
+            ids = []
+            for output, log_prob in outputs.items():
+                ids.append(len(self.outputs))
+                self.outputs.append(output)
+                emissions.append(log_prob)
+            self.gram_readings[gram] = ids
+
+        self.first = np.array([STATE_IDS[output[0]] for output in self.outputs])
+        self.last = np.array([STATE_IDS[output[-1]] for output in self.outputs])
+        self.emissions = np.array(emissions)
+
+    def fit(self, texts):
+        """
+            Биграммы букв по кириллическому корпусу; всё, что не буква алфавита, считается границей слова
+        """
+        counts = np.full((N_STATES, N_STATES), self.smoothing)
+        for text in texts:
+            previous = BOUNDARY
+            for char in text.lower():
+                state = STATE_IDS.get(char, BOUNDARY)
+                if state != BOUNDARY or previous != BOUNDARY:
+                    counts[previous, state] += 1
+                previous = state
+            counts[previous, BOUNDARY] += 1
+
+        self.transitions = np.log(counts / counts.sum(axis=1, keepdims=True))
+
+        # вес прочтения из нескольких букв включает переходы внутри него
+        self.inner = self.emissions.copy()
+        for reading_id, output in enumerate(self.outputs):
+            for left, right in zip(output, output[1:]):
+                self.inner[reading_id] += self.transitions[STATE_IDS[left], STATE_IDS[right]]
+
+        return self
+
+    def fit_default(self):
+        """
+            Обучение на кириллических ресурсах репозитория
+        """
+        texts = []
+        for name in ('ru_cities.txt', 'ru_opposites.txt', 'readme.txt'):
+            texts.extend(load_resource(resource_path(__file__, 'resources', name)))
+        return self.fit(texts)
+
+    def lattice(self, word):
+        """
+            Рёбра решётки сегментации: для каждой конечной позиции j - пары (начало, номер прочтения)
+        """
+        edges = [[] for _ in range(len(word) + 1)]
+        for j in range(1, len(word) + 1):
+            for length in range(1, min(self.max_gram, j) + 1):
+                for reading_id in self.gram_readings.get(word[j - length:j], ()):
+                    edges[j].append((j - length, reading_id))
+        return edges
+
+    def decode_batch(self, words):
+        """
+            Витерби сразу для пачки слов в нижнем регистре; короткие слова просто раньше заканчиваются
+        """
+        n_words, max_len = len(words), max(len(word) for word in words)
+        scores = np.full((n_words, max_len + 1, N_STATES), -np.inf)
+        scores[:, 0, BOUNDARY] = 0.0
+        to_previous = self.transitions.T
+
+        lattices = [self.lattice(word) for word in words]
+        steps = [None]
+        for j in range(1, max_len + 1):
+            word_ids, starts, reading_ids = [], [], []
+            for word_id, edges in enumerate(lattices):
+                if j < len(edges):
+                    for start, reading_id in edges[j]:
+                        word_ids.append(word_id)
+                        starts.append(start)
+                        reading_ids.append(reading_id)
+
+            word_ids, starts, reading_ids = np.array(word_ids), np.array(starts), np.array(reading_ids)
+            candidates = scores[word_ids, starts] + to_previous[self.first[reading_ids]]
+            previous = candidates.argmax(axis=1)
+            best = candidates[np.arange(len(previous)), previous] + self.inner[reading_ids]
+
+            last = self.last[reading_ids]
+            np.maximum.at(scores[:, j], (word_ids, last), best)
+
+            # для каждого (слово, состояние) запоминаем ребро-победителя
+            winners = np.flatnonzero((best == scores[word_ids, j, last]) & np.isfinite(best))
+            chosen = np.full((n_words, N_STATES), -1)
+            chosen[word_ids[winners], last[winners]] = winners
+            steps.append((starts, reading_ids, previous, chosen))
+
+            if self.beam < N_STATES:
+                threshold = np.partition(scores[:, j], N_STATES - self.beam, axis=1)[:, N_STATES - self.beam]
+                scores[:, j][scores[:, j] < threshold[:, None]] = -np.inf
+
+        results = []
+        for word_id, word in enumerate(words):
+            j = len(word)
+            state = int((scores[word_id, j] + self.transitions[:, BOUNDARY]).argmax())
+            outputs = []
+            while j > 0:
+                starts, reading_ids, previous, chosen = steps[j]
+                edge = chosen[word_id, state]
+                outputs.append(self.outputs[reading_ids[edge]])
+                j, state = starts[edge], previous[edge]
+            results.append(''.join(reversed(outputs)))
+        return results
+
+    def decode_many(self, words):
+        """
+            Декодирование множества слов пачками по batch_size, слова сортируются по длине,
+            чтобы в пачке было меньше выравнивания
+        """
+        unique = sorted(set(words), key=len)
+        decoded = {}
+        for i in range(0, len(unique), self.batch_size):
+            batch = unique[i:i + self.batch_size]
+            decoded.update(zip(batch, self.decode_batch(batch)))
+        return [decoded[word] for word in words]
+
+    def transliterate_many(self, texts):
+        """
+            Обратная транслитерация текстов: латинские последовательности всех текстов декодируются вместе,
+            остальные символы переносятся как есть
+        """
+        runs = [[match for match in self.LATIN_RUN.finditer(text)] for text in texts]
+        words = [match.group().lower() for text_runs in runs for match in text_runs]
+        decoded = iter(self.decode_many(words)) if words else iter(())
+
+        results = []
+        for text, text_runs in zip(texts, runs):
+            parts, position = [], 0
+            for match in text_runs:
+                parts.append(text[position:match.start()])
+                parts.append(self.match_case(match.group(), next(decoded)))
+                position = match.end()
+            parts.append(text[position:])
+            results.append(''.join(parts))
+        return results
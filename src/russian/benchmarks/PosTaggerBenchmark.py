@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+    Точность POS-теггера в зависимости от размерности хэшированного пространства признаков:
+    для каждой размерности модель обучается на train, оценивается на dev,
+    печатаются точность, размер весов и время обучения
+
+    python -m src.russian.benchmarks.PosTaggerBenchmark --train train.data --dev dev.data --dims 12 14 16 18
+"""
+import argparse
+import time
+
+from src.russian.NaivePosTagger import evaluate, train
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='POS-tagger accuracy vs hashed feature dimension')
+    parser.add_argument('--train', required=True, help='CoNLL training file')
+    parser.add_argument('--dev', required=True, help='CoNLL evaluation file')
+    parser.add_argument('--dims', type=int, nargs='+', default=[10, 12, 14, 16, 18],
+                        help='powers of two to try as n_features')
+    parser.add_argument('--max-iter', type=int, default=50)
+    args = parser.parse_args()
+
+    rows = []
+    for power in args.dims:
+        checkpoint = time.time()
+        tagger = train(args.train, args.max_iter, 2 ** power)
+        train_time = time.time() - checkpoint
+        scores = evaluate(tagger, args.dev, verbose=False)
+        rows.append((power, scores, tagger.weights.nbytes, train_time))
+
+    print('{:>10} {:>10} {:>12} {:>10} {:>12} {:>10}'.format(
+        'n_features', 'accuracy', 'whole_seq', 'f1_macro', 'weights_kb', 'train_s'))
+    for power, scores, n_bytes, train_time in rows:
+        print('{:>10} {:>10.4f} {:>12.4f} {:>10.4f} {:>12.0f} {:>10.1f}'.format(
+            '2^%d' % power, scores['accuracy'], scores['whole_seq_accuracy'], scores['f1_macro'],
+            n_bytes / 1024, train_time))
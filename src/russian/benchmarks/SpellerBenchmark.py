@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+    Поиск кандидатов StatisticalSpeller с корзинами по длине слова и без них на воспроизводимом
+    наборе опечаток: слова из ru_cities.txt и ru_opposites.txt, в каждом одна правка
+    (удаление, вставка, замена или перестановка соседних букв).
+    Печатает число просмотренных совпадений по нграммам, вычислений расстояния, принятых кандидатов
+    и долю попаданий (принятые / вычисленные)
+
+    python -m src.russian.benchmarks.SpellerBenchmark --queries 400
+"""
+import argparse
+import random
+import re
+import time
+from collections import Counter
+
+from pyxdameraulevenshtein import damerau_levenshtein_distance
+
+from src.russian.ResourceRegistry import load_resource, resource_path
+from src.russian.SpellChecker import StatisticalSpeller
+
+LETTERS = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+
+
+def load_words():
+    words = set()
+    for name in ('ru_cities.txt', 'ru_opposites.txt'):
+        for line in load_resource(resource_path(__file__, '..', 'resources', name)):
+            words.update(word for word in re.split(r'[\s,]+', line.lower()) if len(word) > 2 and word.isalpha())
+    return sorted(words)
+
+
+def typo(rnd, word):
+    i = rnd.randrange(len(word))
+    kind = rnd.randrange(4)
+    if kind == 0:
+        return word[:i] + word[i + 1:]
+    if kind == 1:
+        return word[:i] + rnd.choice(LETTERS) + word[i:]
+    if kind == 2:
+        return word[:i] + rnd.choice(LETTERS.replace(word[i], '')) + word[i + 1:]
+    i = min(i, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def unpruned_candidates(speller, word, stats):
+    """
+        Поиск кандидатов до разбиения индекса по длине: совпадения считаются по всем корзинам
+    """
+    char_ngrams_list = speller.vectorizer.transform([word]).tocoo().col
+    speller.n_candidates = 350 if len(word) <= 4 else 250 if len(word) <= 7 else speller.n_candidates
+
+    counter = Counter()
+    for token_id in char_ngrams_list:
+        for word_ids in speller.index.get(token_id, {}).values():
+            counter.update(word_ids)
+            stats['scanned'] += len(word_ids)
+
+    suggestions = []
+    for word_id, _ in counter.most_common(n=speller.n_candidates):
+        sugg = speller.words_list[word_id]
+        dl_distance = damerau_levenshtein_distance(sugg, word)
+        stats['candidates'] += 1
+        if dl_distance <= speller.max_distance:
+            stats['accepted'] += 1
+            # как и candidates, частота запрашивается для каждого принятого кандидата
+            speller.word_frequency(sugg)
+            suggestions.append((dl_distance, sugg))
+    return min(suggestions, default=None)
+
+
+def pruned_candidates(speller, word, stats):
+    suggestions = [(sugg.distance, sugg.word) for sugg in speller.candidates(word)]
+    stats.update(speller.stats)
+    speller.stats.clear()
+    return min(suggestions, default=None)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='StatisticalSpeller candidate retrieval benchmark')
+    parser.add_argument('--queries', type=int, default=400, help='number of typo queries')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    words = load_words()
+    rnd = random.Random(args.seed)
+    queries = [typo(rnd, rnd.choice(words)) for _ in range(args.queries)]
+    print('{} dictionary words, {} queries'.format(len(words), len(queries)))
+
+    results = {}
+    for name, search in (('all lengths', unpruned_candidates), ('length buckets', pruned_candidates)):
+        speller = StatisticalSpeller().fit(words)
+        stats = Counter()
+        start = time.perf_counter()
+        results[name] = [search(speller, query, stats) for query in queries]
+        elapsed = time.perf_counter() - start
+        print('{:15} scanned {:>8} DL computed {:>6} accepted {:>6} hit rate {:>5.1%} {:>8.1f} ms'.format(
+            name, stats['scanned'], stats['candidates'], stats['accepted'],
+            stats['accepted'] / float(max(stats['candidates'], 1)), elapsed * 1000))
+
+    same = sum(before == after for before, after in zip(results['all lengths'], results['length buckets']))
+    print('nearest candidate identical for {} of {} queries'.format(same, len(queries)))
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+    Бенчмарк NaiveTokenizer на воспроизводимом синтетическом корпусе:
+    цены, URL, e-mail, сокращения, серии знаков препинания, скобки и кавычки.
+    Печатает токены/с, символы/с и пиковую память для каждого режима токенизации
+    и завершается с кодом 1, если пропускная способность упала ниже базовой больше чем на --tolerance,
+    и с кодом 2, если базовых результатов нет и сравнивать не с чем
+
+    python -m src.russian.benchmarks.TokenizerBenchmark --save-baseline
+    python -m src.russian.benchmarks.TokenizerBenchmark --tolerance 0.2
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from src.russian.NaiveTokenizer import NaiveTokenizer
+
+WORDS = ('нефть', 'стоит', 'курс', 'доллара', 'на', 'сегодняшний', 'день', 'составляет', 'в', 'огороде',
+         'бузина', 'а', 'киеве', 'дядька', 'деревне', 'гадюкино', 'снова', 'дожди', 'следите', 'за',
+         'новостями', 'пишите', 'письма', 'ящик', 'температура', 'около', 'градусов', 'тепла', 'спешите',
+         'приобрести', 'автомобили', 'модель', 'телефона', 'вызвала', 'большой', 'интерес', 'у', 'покупателей')
+NAMES = ('Volvo', 'Siemens', 'Санкт-Петербург', 'Москва', 'Кишенёв', 'Гадюкино', 'Пушкин')
+NUMALPHA = ('XS60', 'C-60', '2-х', '27/барр.', 'Ту-154', 'A4')
+DOMAINS = ('facebook.com/zebrochka', 'www.vk.com/id777', 'http://ya.ru/search?q=1', 'dobro@gmail.com',
+           'info@mail.ru', 'example.org')
+PUNCT_RUNS = ('!!!', '?!', '...', '?!..', ' - ', ', ', ' : ', '; ')
+CURRENCY = '$€£₽'
+QUOTES = (('«', '»'), ('"', '"'), ('(', ')'))
+
+
+def price(rnd):
+    number = '{},{:02d}'.format(rnd.randrange(1, 1000), rnd.randrange(100)) if rnd.random() < 0.5 \
+        else '{}.{:02d}'.format(rnd.randrange(1, 1000), rnd.randrange(100))
+    currency = rnd.choice(CURRENCY)
+    return currency + number if currency == '$' else number + rnd.choice(('', ' ')) + currency
+
+
+def sentence(rnd, abbreviations):
+    parts = []
+    for _ in range(rnd.randrange(4, 16)):
+        roll = rnd.random()
+        if roll < 0.6:
+            parts.append(rnd.choice(WORDS))
+        elif roll < 0.68:
+            parts.append(rnd.choice(NAMES))
+        elif roll < 0.74:
+            parts.append(rnd.choice(abbreviations))
+        elif roll < 0.8:
+            parts.append(price(rnd))
+        elif roll < 0.85:
+            parts.append(rnd.choice(DOMAINS))
+        elif roll < 0.9:
+            parts.append(rnd.choice(NUMALPHA))
+        elif roll < 0.95:
+            left, right = rnd.choice(QUOTES)
+            parts.append(left + rnd.choice(WORDS) + ' ' + rnd.choice(WORDS) + right)
+        else:
+            parts.append(rnd.choice(PUNCT_RUNS).strip())
+    text = ' '.join(parts)
+    return text[0].upper() + text[1:] + rnd.choice(('.', '.', '!', '?', ' ...', '!!!'))
+
+
+def make_corpus(n_chars, seed=0):
+    rnd = random.Random(seed)
+    abbreviations = sorted(NaiveTokenizer().abbr - {''})
+    sentences, size = [], 0
+    while size < n_chars:
+        sentences.append(sentence(rnd, abbreviations))
+        size += len(sentences[-1]) + 1
+    return ' '.join(sentences)
+
+
+def run_modes(tokenizer, text):
+    """
+        Режимы токенизации: имя -> функция, возвращающая число токенов
+    """
+    return {
+        'tokenize': lambda: sum(1 for _ in tokenizer.tokenize(text)),
+        'tokenize_spans': lambda: len(tokenizer.tokenize_spans(text)),
+        'tokenize_stream': lambda: sum(1 for _ in tokenizer.tokenize_stream(io.StringIO(text))),
+        'sentences': lambda: sum(len(s.Tokens) for s in tokenizer.sentences(text)),
+    }
+
+
+def measure(run, n_chars, repeat):
+    best, n_tokens = float('inf'), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        n_tokens = run()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'tokens': n_tokens,
+        'tokens_per_sec': n_tokens / best,
+        'chars_per_sec': n_chars / best,
+        'peak_memory_kb': peak / 1024
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+        :return: список режимов, чья скорость упала больше чем на tolerance относительно baseline
+    """
+    regressions = []
+    for mode, result in results.items():
+        if mode not in baseline:
+            continue
+        floor = baseline[mode]['chars_per_sec'] * (1 - tolerance)
+        if result['chars_per_sec'] < floor:
+            regressions.append(mode)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='NaiveTokenizer throughput benchmark')
+    parser.add_argument('--chars', type=int, default=1000000, help='size of the synthetic corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='best of N runs is reported')
+    parser.add_argument('--modes', nargs='*', help='subset of modes to run')
+    parser.add_argument('--baseline', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           'tokenizer_baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='store current results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative throughput drop')
+    args = parser.parse_args()
+
+    text = make_corpus(args.chars, args.seed)
+    tokenizer = NaiveTokenizer()
+    modes = run_modes(tokenizer, text)
+
+    results = {}
+    for mode, run in modes.items():
+        if args.modes and mode not in args.modes:
+            continue
+        results[mode] = measure(run, len(text), args.repeat)
+        print('{:16} {:>10.0f} tokens/s {:>10.0f} chars/s {:>10.0f} KB peak'.format(
+            mode, results[mode]['tokens_per_sec'], results[mode]['chars_per_sec'], results[mode]['peak_memory_kb']
+        ))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'chars': len(text), 'seed': args.seed, 'results': results}, f, indent=2)
+        print('Baseline saved to', args.baseline)
+    elif not os.path.exists(args.baseline):
+        print('No baseline at {}, nothing compared; create it with --save-baseline'.format(args.baseline))
+        sys.exit(2)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for mode in regressions:
+            print('REGRESSION {}: {:.0f} chars/s, baseline {:.0f}'.format(
+                mode, results[mode]['chars_per_sec'], baseline[mode]['chars_per_sec']))
+        if regressions:
+            sys.exit(1)
+        print('No regressions beyond {:.0%}'.format(args.tolerance))
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import os
 import random
 
 
@@ -18,7 +19,8 @@ class GuessCity(object):
         self.attempts = 0
         self.ind = 1
 
-        with open("../resources/ru_cities.txt", "r", encoding='utf-8') as f:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resources", "ru_cities.txt")
+        with open(path, "r", encoding='utf-8') as f:
             self.allowed_cities = [
                 line.strip() for line in f
             ]
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import os
 import random
 from collections import defaultdict
 
@@ -19,7 +20,8 @@ class OppositesGame(object):
             "Правильно. Молодец!"
         ]
 
-        with open("../resources/ru_opposites.txt", "r", encoding='utf-8') as f:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resources", "ru_opposites.txt")
+        with open(path, "r", encoding='utf-8') as f:
             for line in f:
                 (word, opposites) = line.split()
                 opposites = opposites.split(",")